@@ -27,6 +27,14 @@ The app is intentionally simple so students (in an NLP course) can read/understa
 Run the application:
 - uvicorn app:app --reload --port 8001
 
+Optional speed-ups (nothing above requires them):
+- pip install orjson uvloop httptools
+  orjson is picked up by the app; uvicorn uses uvloop/httptools automatically
+  when installed (or explicitly: --loop uvloop --http httptools).
+- uvicorn app:app --port 8001 --workers 4
+  The app only waits on the external service, so ~2 workers per CPU core is a
+  reasonable start. Each worker keeps its own metrics.
+
 ---------------------------------------------------------------------------
 PROMPT for dataset (embedded verbatim as requested)
 ---------------------------------------------------------------------------
@@ -63,17 +71,40 @@ Generate 40 data items
 
 from __future__ import annotations
 
-import statistics
+import asyncio
+import html
+import importlib.util
+import threading
 import time
+from collections import deque
+from contextlib import asynccontextmanager
 from dataclasses import dataclass, field
 import json
-from typing import Any, Dict, List, Literal, Optional, Tuple
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional, Tuple
 
 
 import httpx
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import HTMLResponse, JSONResponse, ORJSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field # , HttpUrl
+from starlette.types import Receive, Scope, Send
+
+try:  # optional: orjson is faster, but the app works fine with the stdlib json
+    import orjson
+except ImportError:
+    orjson = None
+
+
+
+def _stdlib_json_dumps(obj: Any) -> bytes:
+    # Compact separators, like orjson, so the fallback doesn't send extra bytes.
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+json_loads = orjson.loads if orjson is not None else json.loads
+json_dumps = orjson.dumps if orjson is not None else _stdlib_json_dumps
+FastJSONResponse = ORJSONResponse if orjson is not None else JSONResponse
 
 
 SentimentLabel = Literal["positive", "neutral", "negative"]
@@ -99,113 +130,162 @@ class ScoreRequest(BaseModel):
     text: str = Field(..., min_length=1, description="Text to score")
 
 
-class BatchRequest(BaseModel):
-    """Request payload for batch evaluation on a dataset.
+@dataclass
+class Metrics:
+    """Simple in-memory operational metrics.
 
-    Parameters
-    ----------
-    service_url : str
-        Base URL for the external sentiment service.
-    dataset : list
-        List of [text, gold_label] pairs.
+    The average covers all requests (via a running sum); p95 is computed over the
+    most recent 1024 latencies so memory and snapshot cost stay bounded.
 
-    Examples
-    --------
-    >>> req = BatchRequest(service_url="http://localhost:8000", dataset=[["Good course", "positive"]])
-    >>> req.dataset[0][1]
-    'positive'
+    `record` is called from async handlers on the event loop, while the sync
+    /api/metrics handler runs `snapshot` in FastAPI's threadpool, so both take a
+    lock. (Each worker process keeps its own metrics.)
     """
-
-    service_url: str
-    dataset: List[List[str]] = Field(..., description='List like [["text", "positive"], ...]')
-
-
-@dataclass
-class Metrics:
-    """Simple in-memory operational metrics."""
     total_requests: int = 0
     success_requests: int = 0
     failed_requests: int = 0
-    latencies_ms: List[float] = field(default_factory=list)
+    latencies_ms: deque = field(default_factory=lambda: deque(maxlen=1024))
+    latency_sum_ms: float = 0.0
     last_latency_ms: Optional[float] = None
+    cache_hits: int = 0  # batch items answered by another identical item's call
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
 
     def record(self, ok: bool, latency_ms: float) -> None:
-        self.total_requests += 1
-        if ok:
-            self.success_requests += 1
-        else:
-            self.failed_requests += 1
-        self.last_latency_ms = latency_ms
-        self.latencies_ms.append(latency_ms)
+        with self._lock:
+            self.total_requests += 1
+            if ok:
+                self.success_requests += 1
+            else:
+                self.failed_requests += 1
+            self.last_latency_ms = latency_ms
+            self.latencies_ms.append(latency_ms)
+            self.latency_sum_ms += latency_ms
+
+    def record_cache_hits(self, n: int) -> None:
+        with self._lock:
+            self.cache_hits += n
 
     def snapshot(self) -> Dict[str, Any]:
-        avg = statistics.mean(self.latencies_ms) if self.latencies_ms else None
+        # Copy under the lock (iterating a deque while it is appended to raises),
+        # then sort without holding it.
+        with self._lock:
+            out: Dict[str, Any] = {
+                "total_requests": self.total_requests,
+                "success_requests": self.success_requests,
+                "failed_requests": self.failed_requests,
+                "last_latency_ms": self.last_latency_ms,
+                "avg_latency_ms": (self.latency_sum_ms / self.total_requests) if self.total_requests else None,
+                "cache_hits": self.cache_hits,
+            }
+            xs = list(self.latencies_ms)
         p95 = None
-        if len(self.latencies_ms) >= 20:
-            xs = sorted(self.latencies_ms)
-            p95 = xs[int(0.95 * (len(xs) - 1))]
-        return {
-            "total_requests": self.total_requests,
-            "success_requests": self.success_requests,
-            "failed_requests": self.failed_requests,
-            "last_latency_ms": self.last_latency_ms,
-            "avg_latency_ms": avg,
-            "p95_latency_ms": p95,
-        }
-
+        n = len(xs)
+        if n >= 20:
+            # A plain sort: the window is at most 1024 values, and at that size
+            # C's sort beats a partial selection done in Python.
+            p95 = sorted(xs)[int(0.95 * (n - 1))]
+        out["p95_latency_ms"] = p95
+        return out
 
-app = FastAPI(title="DTU Sentiment Demo Frontend", version="1.0.0")
-metrics = Metrics()
 
 # ---- Configuration you can tweak ----
 DEFAULT_SERVICE_URL = "http://localhost:8000"
 REQUEST_TIMEOUT_SECONDS = 4.0  # pedagogical: fail fast with a helpful message
+# Max in-flight requests to the external service during a batch run. 32 matches
+# the reference API's default MAX_BATCH, so its batcher can fill a whole batch;
+# it also equals the client's keep-alive pool, so every call reuses a connection.
+BATCH_CONCURRENCY = 32
+
+# One HTTP client for the whole app lifetime, so connections to the external
+# service are kept alive and reused instead of re-opened for every call.
+CLIENT: Optional[httpx.AsyncClient] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    global CLIENT
+    CLIENT = httpx.AsyncClient(
+        # HTTP/2 needs the optional 'h2' package (pip install "httpx[http2]") and is
+        # only negotiated with https:// services; otherwise HTTP/1.1 keep-alive is used.
+        http2=importlib.util.find_spec("h2") is not None,
+        timeout=REQUEST_TIMEOUT_SECONDS,
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+    )
+    yield
+    await CLIENT.aclose()
+
+
+class StreamingAwareGZipMiddleware(GZipMiddleware):
+    """GZipMiddleware that skips the streamed /api/batch response.
+
+    Compression would hold the streamed rows back in its buffer until enough
+    bytes pile up, so the page would no longer fill in row by row.
+    """
+
+    UNCOMPRESSED_PATHS = frozenset({"/api/batch"})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["path"] in self.UNCOMPRESSED_PATHS:
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+app = FastAPI(
+    title="DTU Sentiment Demo Frontend",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
+)
+# Compress larger responses (the page itself, metrics); not the batch stream.
+app.add_middleware(StreamingAwareGZipMiddleware, minimum_size=1024)
+metrics = Metrics()
 
 # ---- Paste your 40 items here (or keep the small starter list) ----
-# Format: [["text", "positive"], ["text", "neutral"], ...]
-DATASET: List[List[str]] = [
-  ['Great course, learned a lot.', 'positive'],
-  ['Really solid DTU course with clear structure and useful exercises.', 'positive'],
-  ['Nicki was energetic and made MLOps feel practical and fun.', 'positive'],
-  ['The lectures were okay, but the pace felt uneven.', 'neutral'],
-  ['This course was hard, but worth it.', 'positive'],
-  ['Tue’s reinforcement learning course is brutal, yet the learning outcome is amazing.', 'positive'],
-  ['Bjørn explained the core ML ideas clearly and the project was motivating.', 'positive'],
-  ['I liked the course book and how it matched the weekly plan.', 'positive'],
-  ['The feedback on assignments came a bit late.', 'neutral'],
-  ['Finn’s NLP lectures were confusing and the slides had too many gaps.', 'negative'],
-  ['Overall fine, nothing special.', 'neutral'],
-  ['Excellent vocabulary and examples; I left each week with new tools.', 'positive'],
-  ['good course but the typos in the material was annoying lol', 'neutral'],
-  ['Nicki’s demos were sharp, and the TA feedback was super actionable.', 'positive'],
-  ['The course is well organized, but I wish there were more office hours.', 'neutral'],
-  ['Finn taught NLP, but honestly it felt messy and underprepared.', 'negative'],
-  ['Ivana’s cognitive science lectures were inspiring and beautifully presented.', 'positive'],
-  ['The teacher was nice and helpful.', 'positive'],
-  ['Too many mandatory readings, but the exams were fair.', 'neutral'],
-  ['Loved the project work and the way we got iterative feedback.', 'positive'],
-
-  ['Mega godt kursus!', 'positive'],
-  ['Rigtig god struktur og gode øvelser på DTU, jeg følte mig tryg gennem hele forløbet.', 'positive'],
-  ['Nicki gjorde MLOps levende med hands-on demoer, og feedbacken var hurtig og konkret.', 'positive'],
-  ['Kurset var okay, men tempoet svingede lidt fra uge til uge.', 'neutral'],
-  ['Svært kursus, men jeg lærte virkelig meget.', 'positive'],
-  ['Tue’s reinforcement learning var vildt svært, men undervisningen var stærk og gav mening til sidst.', 'positive'],
-  ['Bjørn var god til at forklare maskinlæring, og projektet bandt det hele sammen.', 'positive'],
-  ['Bogen passede fint til kurset, og kapitlerne blev brugt på en fornuftig måde.', 'positive'],
-  ['Jeg savnede lidt mere feedback på de tidlige afleveringer.', 'neutral'],
-  ['Finns NLP-kursus var rodet, og jeg forstod ofte ikke pointen med øvelserne.', 'negative'],
-  ['Helt fint, ikke noget wow.', 'neutral'],
-  ['Sproget i materialet var præcist, og eksemplerne var elegante og velvalgte.', 'positive'],
-  ['det var ok kursus men opgaverne var lidt mærkelige og der var mange fejl', 'neutral'],
-  ['Nicki var mega engageret, og man fik god, hurtig feedback på pipeline-opgaverne.', 'positive'],
-  ['Kurset fungerede, men der kunne godt være lidt bedre koordinering mellem forelæsning og øvelsestime.', 'neutral'],
-  ['Finn underviser i NLP, men det var frustrerende: uklare krav og for få forklaringer.', 'negative'],
-  ['Ivana var fantastisk—tydelig formidling, stærke diskussioner, og jeg gik derfra med nye perspektiver.', 'positive'],
-  ['Underviseren var hjælpsom, og jeg følte mig set i timerne.', 'positive'],
-  ['For meget læsning nogle uger, men eksamen virkede rimelig.', 'neutral'],
-  ['Jeg elskede projektet, og feedback-loopet gjorde, at vi faktisk blev bedre undervejs.', 'positive']
-]
+# Format: (("text", "positive"), ("text", "neutral"), ...)  (read-only, hence tuples)
+DATASET: Tuple[Tuple[str, str], ...] = (
+  ('Great course, learned a lot.', 'positive'),
+  ('Really solid DTU course with clear structure and useful exercises.', 'positive'),
+  ('Nicki was energetic and made MLOps feel practical and fun.', 'positive'),
+  ('The lectures were okay, but the pace felt uneven.', 'neutral'),
+  ('This course was hard, but worth it.', 'positive'),
+  ('Tue’s reinforcement learning course is brutal, yet the learning outcome is amazing.', 'positive'),
+  ('Bjørn explained the core ML ideas clearly and the project was motivating.', 'positive'),
+  ('I liked the course book and how it matched the weekly plan.', 'positive'),
+  ('The feedback on assignments came a bit late.', 'neutral'),
+  ('Finn’s NLP lectures were confusing and the slides had too many gaps.', 'negative'),
+  ('Overall fine, nothing special.', 'neutral'),
+  ('Excellent vocabulary and examples; I left each week with new tools.', 'positive'),
+  ('good course but the typos in the material was annoying lol', 'neutral'),
+  ('Nicki’s demos were sharp, and the TA feedback was super actionable.', 'positive'),
+  ('The course is well organized, but I wish there were more office hours.', 'neutral'),
+  ('Finn taught NLP, but honestly it felt messy and underprepared.', 'negative'),
+  ('Ivana’s cognitive science lectures were inspiring and beautifully presented.', 'positive'),
+  ('The teacher was nice and helpful.', 'positive'),
+  ('Too many mandatory readings, but the exams were fair.', 'neutral'),
+  ('Loved the project work and the way we got iterative feedback.', 'positive'),
+
+  ('Mega godt kursus!', 'positive'),
+  ('Rigtig god struktur og gode øvelser på DTU, jeg følte mig tryg gennem hele forløbet.', 'positive'),
+  ('Nicki gjorde MLOps levende med hands-on demoer, og feedbacken var hurtig og konkret.', 'positive'),
+  ('Kurset var okay, men tempoet svingede lidt fra uge til uge.', 'neutral'),
+  ('Svært kursus, men jeg lærte virkelig meget.', 'positive'),
+  ('Tue’s reinforcement learning var vildt svært, men undervisningen var stærk og gav mening til sidst.', 'positive'),
+  ('Bjørn var god til at forklare maskinlæring, og projektet bandt det hele sammen.', 'positive'),
+  ('Bogen passede fint til kurset, og kapitlerne blev brugt på en fornuftig måde.', 'positive'),
+  ('Jeg savnede lidt mere feedback på de tidlige afleveringer.', 'neutral'),
+  ('Finns NLP-kursus var rodet, og jeg forstod ofte ikke pointen med øvelserne.', 'negative'),
+  ('Helt fint, ikke noget wow.', 'neutral'),
+  ('Sproget i materialet var præcist, og eksemplerne var elegante og velvalgte.', 'positive'),
+  ('det var ok kursus men opgaverne var lidt mærkelige og der var mange fejl', 'neutral'),
+  ('Nicki var mega engageret, og man fik god, hurtig feedback på pipeline-opgaverne.', 'positive'),
+  ('Kurset fungerede, men der kunne godt være lidt bedre koordinering mellem forelæsning og øvelsestime.', 'neutral'),
+  ('Finn underviser i NLP, men det var frustrerende: uklare krav og for få forklaringer.', 'negative'),
+  ('Ivana var fantastisk—tydelig formidling, stærke diskussioner, og jeg gik derfra med nye perspektiver.', 'positive'),
+  ('Underviseren var hjælpsom, og jeg følte mig set i timerne.', 'positive'),
+  ('For meget læsning nogle uger, men eksamen virkede rimelig.', 'neutral'),
+  ('Jeg elskede projektet, og feedback-loopet gjorde, at vi faktisk blev bedre undervejs.', 'positive')
+)
 
 
 def score_to_label(score: float) -> SentimentLabel:
@@ -239,9 +319,39 @@ def score_to_label(score: float) -> SentimentLabel:
     return "neutral"
 
 
+# Label codes used on the batch path: index into _LABELS.
+_LABELS: Tuple[SentimentLabel, ...] = ("negative", "neutral", "positive")
+
+
+def _score_to_code(score: float) -> int:
+    """Branch-free equivalent of score_to_label(), returning an index into _LABELS."""
+    return 1 + (score >= 1) - (score <= -1)
+
+
+_GOLD_CODES: Dict[str, int] = {label: code for code, label in enumerate(_LABELS)}
+
+# Predicted-label column of the batch table, indexed by code; a failed call has
+# code -1 and so picks the trailing "—".
+_PRED_LABELS: Tuple[str, ...] = _LABELS + ("—",)
+
+# One <tr> of the batch results table; api_batch streams these to the page.
+_BATCH_ROW_HTML = (
+    '<tr><td class="mono">{i}</td><td>{text}</td><td class="mono">{gold}</td>'
+    '<td class="mono"{score_attrs}>{score}</td><td class="mono">{pred}</td><td class="mono">{ok}</td>'
+    '<td class="mono">{latency_ms:.1f}</td></tr>'
+)
+
+
+def sentiment_endpoint(service_url: str) -> str:
+    """Full URL of the sentiment route for a service base URL."""
+    return service_url.rstrip("/") + "/v1/sentiment"
+
+
 async def call_external_service(service_url: str, text: str) -> Tuple[Optional[float], Dict[str, Any]]:
     """Call the student-built sentiment service and return (score, debug_info).
 
+    Uses the app-wide CLIENT, which is opened/closed by `lifespan`.
+
     Returns
     -------
     score : float | None
@@ -249,91 +359,64 @@ async def call_external_service(service_url: str, text: str) -> Tuple[Optional[f
     debug_info : dict
         Includes latency_ms and any error information.
     """
-    endpoint = service_url.rstrip("/") + "/v1/sentiment"
+    return await _post_to_endpoint(sentiment_endpoint(service_url), text)
+
+
+async def _post_to_endpoint(endpoint: str, text: str) -> Tuple[Optional[float], Dict[str, Any]]:
+    """call_external_service() for an already resolved endpoint URL (see sentiment_endpoint)."""
+    score: Optional[float] = None
+    ok = False
+    info: Dict[str, Any] = {"endpoint": endpoint}
     t0 = time.perf_counter()
     try:
-        async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT_SECONDS) as client:
-            r = await client.post(endpoint, json={"text": text})
-        latency_ms = (time.perf_counter() - t0) * 1000.0
+        r = await CLIENT.post(endpoint, json={"text": text})
 
         if r.status_code != 200:
-            metrics.record(ok=False, latency_ms=latency_ms)
-            return None, {
-                "latency_ms": latency_ms,
-                "error": (
-                    f"External service responded with HTTP {r.status_code}. "
-                    f"Expected 200. Response body (truncated): {r.text[:200]!r}"
-                ),
-                "endpoint": endpoint,
-            }
-
-        data = r.json()
-        if "score" not in data:
-            metrics.record(ok=False, latency_ms=latency_ms)
-            return None, {
-                "latency_ms": latency_ms,
-                "error": (
+            info["error"] = (
+                f"External service responded with HTTP {r.status_code}. "
+                f"Expected 200. Response body (truncated): {r.text[:200]!r}"
+            )
+        else:
+            data = json_loads(r.content)
+            if "score" not in data:
+                info["error"] = (
                     "External service returned JSON without the required field 'score'. "
                     f"Got keys: {list(data.keys())!r}"
-                ),
-                "endpoint": endpoint,
-            }
-
-        score = float(data["score"])
-        if not (-5 <= score <= 5):
-            # We still accept but warn; pedagogical.
-            metrics.record(ok=True, latency_ms=latency_ms)
-            return score, {
-                "latency_ms": latency_ms,
-                "warning": f"Score {score} is outside expected range [-5, 5].",
-                "endpoint": endpoint,
-            }
-
-        metrics.record(ok=True, latency_ms=latency_ms)
-        return score, {"latency_ms": latency_ms, "endpoint": endpoint}
+                )
+            else:
+                score = float(data["score"])
+                ok = True
+                if not (-5 <= score <= 5):
+                    # We still accept but warn; pedagogical.
+                    info["warning"] = f"Score {score} is outside expected range [-5, 5]."
 
     except httpx.TimeoutException:
-        latency_ms = (time.perf_counter() - t0) * 1000.0
-        metrics.record(ok=False, latency_ms=latency_ms)
-        return None, {
-            "latency_ms": latency_ms,
-            "error": (
-                f"Timeout after {REQUEST_TIMEOUT_SECONDS:.1f}s while calling the external service. "
-                "This usually means the container is not running, the URL/port is wrong, or the model is too slow. "
-                "Try: (1) open the service docs at /docs, (2) verify /v1/sentiment exists, (3) reduce model size."
-            ),
-            "endpoint": endpoint,
-        }
+        info["error"] = (
+            f"Timeout after {REQUEST_TIMEOUT_SECONDS:.1f}s while calling the external service. "
+            "This usually means the container is not running, the URL/port is wrong, or the model is too slow. "
+            "Try: (1) open the service docs at /docs, (2) verify /v1/sentiment exists, (3) reduce model size."
+        )
     except httpx.RequestError as e:
-        latency_ms = (time.perf_counter() - t0) * 1000.0
-        metrics.record(ok=False, latency_ms=latency_ms)
-        return None, {
-            "latency_ms": latency_ms,
-            "error": (
-                "Could not reach the external service (network error). "
-                "Check the base URL and whether the container is running. "
-                f"Details: {type(e).__name__}: {e}"
-            ),
-            "endpoint": endpoint,
-        }
+        info["error"] = (
+            "Could not reach the external service (network error). "
+            "Check the base URL and whether the container is running. "
+            f"Details: {type(e).__name__}: {e}"
+        )
     except Exception as e:
+        info["error"] = (
+            "Unexpected error while calling/parsing the external service response. "
+            f"Details: {type(e).__name__}: {e}"
+        )
+    finally:
+        # One timer read and one metrics update, whatever happened above.
         latency_ms = (time.perf_counter() - t0) * 1000.0
-        metrics.record(ok=False, latency_ms=latency_ms)
-        return None, {
-            "latency_ms": latency_ms,
-            "error": (
-                "Unexpected error while calling/parsing the external service response. "
-                f"Details: {type(e).__name__}: {e}"
-            ),
-            "endpoint": endpoint,
-        }
+        info["latency_ms"] = latency_ms
+        metrics.record(ok=ok, latency_ms=latency_ms)
 
+    return score, info
 
-@app.get("/", response_class=HTMLResponse)
-def index() -> str:
-    dataset_js = json.dumps(DATASET, ensure_ascii=False)
 
-    return """<!doctype html>
+_TEMPLATE = """<!doctype html>
 <html lang="en">
 <head>
   <meta charset="utf-8" />
@@ -591,6 +674,7 @@ def index() -> str:
           <span class="pill">Total: ${m.total_requests}</span>
           <span class="pill">Success: ${m.success_requests}</span>
           <span class="pill">Failed: ${m.failed_requests}</span>
+          <span class="pill">Cache hits: ${m.cache_hits}</span>
         </div>
         <div class="small" style="margin-top:10px;">
           Latency (ms): last <span class="mono">${last}</span>, avg <span class="mono">${avg}</span>, p95 <span class="mono">${p95}</span>
@@ -709,30 +793,16 @@ def index() -> str:
         body: JSON.stringify({ service_url: serviceUrl, dataset: DATASET })
       });
 
-      const data = await r.json();
-      await refreshMetrics();
-
       if (!r.ok) {
+        const data = await r.json();
+        await refreshMetrics();
         showBatchError(data.detail || "Unknown error.");
         return;
       }
 
-      // Summary
-      const sum = document.getElementById("batchSummary");
-      sum.innerHTML = `
-        <div style="display:flex; flex-wrap:wrap; gap:8px;">
-          <span class="pill">Items: <span class="mono">${data.n}</span></span>
-          <span class="pill">Accuracy: <span class="mono">${(100*data.accuracy).toFixed(1)}%</span></span>
-          <span class="pill">Avg latency/item: <span class="mono">${data.avg_latency_ms.toFixed(1)} ms</span></span>
-        </div>
-        <div class="small" style="margin-top:10px;">
-          Label mapping: score ≤ -1 → negative, -1..1 → neutral, score ≥ 1 → positive.
-        </div>
-      `;
-      setVisible("batchSummary", true);
-
-      // Table
-      let html = `
+      // Table: one empty row per item, filled in as results stream in.
+      const wrap = document.getElementById("batchTableWrap");
+      wrap.innerHTML = `
         <table>
           <thead>
             <tr>
@@ -745,26 +815,53 @@ def index() -> str:
               <th>Latency (ms)</th>
             </tr>
           </thead>
-          <tbody>
+          <tbody id="batchRows">${"<tr></tr>".repeat(DATASET.length)}</tbody>
+        </table>
       `;
-      data.rows.forEach((row, i) => {
-        html += `
-          <tr>
-            <td class="mono">${i+1}</td>
-            <td>${escapeHtml(row.text)}</td>
-            <td class="mono">${row.gold}</td>
-            <td class="mono">${row.score == null ? "—" : row.score}</td>
-            <td class="mono">${row.pred == null ? "—" : row.pred}</td>
-            <td class="mono">${row.ok ? "✓" : "×"}</td>
-            <td class="mono">${row.latency_ms.toFixed(1)}</td>
-          </tr>
-        `;
-      });
-      html += "</tbody></table>";
-
-      const wrap = document.getElementById("batchTableWrap");
-      wrap.innerHTML = html;
       setVisible("batchTableWrap", true);
+      const rows = document.getElementById("batchRows").rows;
+
+      // The response is NDJSON: one JSON object per line. Rows (already
+      // rendered and escaped by the backend) come first, the summary last.
+      let data = null;
+      const reader = r.body.getReader();
+      const decoder = new TextDecoder();
+      let buf = "";
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buf += decoder.decode(value, { stream: true });
+        let nl;
+        while ((nl = buf.indexOf("\\n")) >= 0) {
+          const msg = JSON.parse(buf.slice(0, nl));
+          buf = buf.slice(nl + 1);
+          if ("html" in msg) {
+            rows[msg.i].outerHTML = msg.html;
+          } else {
+            data = msg;
+          }
+        }
+      }
+      await refreshMetrics();
+
+      if (!data) {
+        showBatchError("The batch stream ended before the summary arrived.");
+        return;
+      }
+
+      // Summary
+      const sum = document.getElementById("batchSummary");
+      sum.innerHTML = `
+        <div style="display:flex; flex-wrap:wrap; gap:8px;">
+          <span class="pill">Items: <span class="mono">${data.n}</span></span>
+          <span class="pill">Accuracy: <span class="mono">${(100*data.accuracy).toFixed(1)}%</span></span>
+          <span class="pill">Avg latency/item: <span class="mono">${data.avg_latency_ms.toFixed(1)} ms</span></span>
+        </div>
+        <div class="small" style="margin-top:10px;">
+          Label mapping: score ≤ -1 → negative, -1..1 → neutral, score ≥ 1 → positive.
+        </div>
+      `;
+      setVisible("batchSummary", true);
     });
 
     // Boot
@@ -773,7 +870,22 @@ def index() -> str:
   </script>
 </body>
 </html>
-""".replace("__DATASET_JSON__", dataset_js).replace("__DEFAULT_SERVICE_URL__", DEFAULT_SERVICE_URL)
+"""
+
+# DATASET and DEFAULT_SERVICE_URL are fixed at import, so the page is rendered
+# (and encoded) once instead of on every GET /.
+_DATASET_JSON = (
+    orjson.dumps(DATASET).decode("utf-8") if orjson is not None else json.dumps(DATASET, ensure_ascii=False)
+)
+_INDEX_HTML = _TEMPLATE.replace("__DATASET_JSON__", _DATASET_JSON).replace(
+    "__DEFAULT_SERVICE_URL__", DEFAULT_SERVICE_URL
+)
+_INDEX_BYTES = _INDEX_HTML.encode("utf-8")
+
+
+@app.get("/", response_class=HTMLResponse)
+def index() -> HTMLResponse:
+    return HTMLResponse(content=_INDEX_BYTES)
 
 
 @app.post("/api/score")
@@ -782,7 +894,7 @@ async def api_score(req: ScoreRequest) -> JSONResponse:
     score, info = await call_external_service(str(req.service_url), req.text)
     if score is None:
         # Pedagogic error messages come from call_external_service()
-        return JSONResponse(status_code=502, content={"detail": info.get("error", "Unknown error.")})
+        return FastJSONResponse(status_code=502, content={"detail": info.get("error", "Unknown error.")})
 
     label = score_to_label(score)
     payload: Dict[str, Any] = {
@@ -792,88 +904,133 @@ async def api_score(req: ScoreRequest) -> JSONResponse:
     }
     if "warning" in info:
         payload["warning"] = info["warning"]
-    return JSONResponse(content=payload)
+    return FastJSONResponse(content=payload)
+
+
+def _bad_request(detail: str) -> JSONResponse:
+    """400 response with a pedagogic message for the page to show."""
+    return FastJSONResponse(status_code=400, content={"detail": detail})
 
 
 @app.post("/api/batch")
-async def api_batch(req: BatchRequest) -> JSONResponse:
+async def api_batch(request: Request) -> Response:
     """Run a batch evaluation on a [text, gold_label] dataset.
 
+    The JSON body has two fields:
+
+    - service_url : str, base URL for the external sentiment service.
+    - dataset : list of [text, gold_label] pairs, e.g. [["Good course", "positive"]].
+
     Notes
     -----
-    This runs requests sequentially for clarity (teaching). The student-built
-    service should still be capable of handling concurrent clients; you can
-    trivially parallelize this later if desired.
+    The body is parsed directly (no Pydantic model): the per-item loop below is
+    all the validation the dataset needs. The whole dataset is validated before
+    any request is sent. Items are then scored concurrently (at most
+    BATCH_CONCURRENCY in flight) over the shared CLIENT, so the student-built
+    service should be able to handle concurrent clients. Duplicate texts are
+    only sent once.
+
+    The response is NDJSON: one {"i": index, "html": "<tr>...</tr>"} line per item
+    as soon as its result is in (plus "error" with the explanation if the call
+    failed), then a final summary line with n, correct,
+    accuracy and avg_latency_ms. Validation errors are returned as a plain 400
+    before streaming starts.
     """
-    rows_out: List[Dict[str, Any]] = []
-    latencies: List[float] = []
-    correct = 0
-    n = 0
-
-    for item in req.dataset:
-        if not (isinstance(item, list) and len(item) == 2):
-            return JSONResponse(
-                status_code=400,
-                content={"detail": "Dataset must be a list of [text, gold_label] pairs."},
-            )
-
-        text, gold = item[0], item[1]
-        if gold not in ("positive", "neutral", "negative"):
-            return JSONResponse(
-                status_code=400,
-                content={"detail": f"Gold label must be positive/neutral/negative. Got: {gold!r}"},
-            )
-
-        score, info = await call_external_service(str(req.service_url), text)
-        latency_ms = float(info.get("latency_ms", 0.0))
-        latencies.append(latency_ms)
-
-        if score is None:
-            # Count as incorrect but keep going; useful for demos.
-            rows_out.append(
+    try:
+        payload = json_loads(await request.body())
+        service_url = str(payload["service_url"])
+        dataset = payload["dataset"]
+    except (ValueError, TypeError, KeyError):
+        return _bad_request('Request body must be JSON like {"service_url": "...", "dataset": [...]}.')
+    if not isinstance(dataset, list):
+        return _bad_request("Dataset must be a list of [text, gold_label] pairs.")
+
+    # Split the dataset into parallel columns: texts and integer gold codes.
+    texts: List[str] = []
+    gold_codes: List[int] = []
+    for item in dataset:
+        # The unpack itself checks for a pair; the dict lookup checks the label.
+        try:
+            text, gold = item
+            code = _GOLD_CODES[gold]
+        except (TypeError, ValueError):
+            return _bad_request("Dataset must be a list of [text, gold_label] pairs.")
+        except KeyError:
+            return _bad_request(f"Gold label must be positive/neutral/negative. Got: {gold!r}")
+        if not isinstance(text, str):
+            return _bad_request("Dataset must be a list of [text, gold_label] pairs.")
+        texts.append(text)
+        gold_codes.append(code)
+
+    endpoint = sentiment_endpoint(service_url)
+
+    async def _one(sem: asyncio.Semaphore, text: str) -> Tuple[str, Tuple[Optional[float], Dict[str, Any]]]:
+        async with sem:
+            return text, await _post_to_endpoint(endpoint, text)
+
+    # Identical texts within the batch share one call to the service. (Results are
+    # deliberately not cached across batches: students re-deploy their service
+    # and expect a re-run to hit the new version.)
+    positions: Dict[str, List[int]] = {}
+    for i, text in enumerate(texts):
+        positions.setdefault(text, []).append(i)
+    metrics.record_cache_hits(len(texts) - len(positions))
+
+    sem = asyncio.Semaphore(BATCH_CONCURRENCY)
+    tasks = [asyncio.create_task(_one(sem, text)) for text in positions]
+
+    async def stream() -> AsyncIterator[bytes]:
+        total_latency_ms = 0.0
+        correct = 0
+        try:
+            # Emit each row as soon as its call finishes (in completion order);
+            # "i" tells the page which table row to fill in.
+            for next_done in asyncio.as_completed(tasks):
+                text, (score, info) = await next_done
+                # Failed calls get the code -1, which never equals a gold code.
+                code = -1 if score is None else _score_to_code(score)
+                latency_ms = float(info.get("latency_ms", 0.0))
+                # A failed call's explanation (timeout, HTTP status, missing
+                # "score", ...) goes on the Score cell as a tooltip and in the line.
+                error = info.get("error")
+                score_attrs = f' title="{html.escape(error)}" style="cursor:help"' if error else ""
+                error_json = b',"error":' + json_dumps(error) if error else b""
+                for i in positions[text]:
+                    gold_code = gold_codes[i]
+                    total_latency_ms += latency_ms
+                    correct += int(code == gold_code)
+                    row_html = _BATCH_ROW_HTML.format(
+                        i=i + 1,
+                        text=html.escape(text),
+                        gold=_LABELS[gold_code],
+                        score="—" if score is None else score,
+                        score_attrs=score_attrs,
+                        pred=_PRED_LABELS[code],
+                        ok="✓" if code == gold_code else "×",
+                        latency_ms=latency_ms,
+                    )
+                    # Only the HTML needs escaping; no dict per row.
+                    yield b'{"i":%d,"html":%s%s}\n' % (i, json_dumps(row_html), error_json)
+
+            n = len(texts)
+            yield json_dumps(
                 {
-                    "text": text,
-                    "gold": gold,
-                    "score": None,
-                    "pred": None,
-                    "ok": False,
-                    "latency_ms": latency_ms,
-                    "error": info.get("error"),
+                    "n": n,
+                    "correct": correct,
+                    "accuracy": (correct / n) if n else 0.0,
+                    "avg_latency_ms": (total_latency_ms / n) if n else 0.0,
                 }
-            )
-            n += 1
-            continue
-
-        pred = score_to_label(score)
-        ok = (pred == gold)
-        correct += int(ok)
-        n += 1
-        rows_out.append(
-            {
-                "text": text,
-                "gold": gold,
-                "score": score,
-                "pred": pred,
-                "ok": ok,
-                "latency_ms": latency_ms,
-            }
-        )
-
-    accuracy = (correct / n) if n else 0.0
-    avg_latency = statistics.mean(latencies) if latencies else 0.0
+            ) + b"\n"
+        finally:
+            # Stop outstanding calls if the client went away mid-stream.
+            for task in tasks:
+                task.cancel()
 
-    return JSONResponse(
-        content={
-            "n": n,
-            "correct": correct,
-            "accuracy": accuracy,
-            "avg_latency_ms": avg_latency,
-            "rows": rows_out,
-        }
-    )
+    # Not compressed (see StreamingAwareGZipMiddleware), so rows arrive as they are sent.
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
 
 @app.get("/api/metrics")
 def api_metrics() -> JSONResponse:
     """Return a snapshot of in-memory metrics."""
-    return JSONResponse(content=metrics.snapshot())
+    return FastJSONResponse(content=metrics.snapshot())
@@ -0,0 +1,106 @@
+import os
+import sys
+from collections import Counter
+
+# Make 'app' importable no matter where pytest is started from
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import app as frontend
+
+# Fake external service: the score is picked from the text, and a few texts fail
+SCORES = {"Great course": 4.0, "Okay course": 0.2, "Bad course": -4.0}
+calls = Counter()
+
+
+def fake_service(request: httpx.Request) -> httpx.Response:
+    text = frontend.json_loads(request.content)["text"]
+    calls[text] += 1
+    if text == "Server error":
+        return httpx.Response(500, text="boom")
+    if text == "No score":
+        return httpx.Response(200, json={"label": "positive"})
+    return httpx.Response(200, json={"score": SCORES[text]})
+
+
+@pytest.fixture
+def client():
+    with TestClient(frontend.app) as c:
+        # Swap the app's shared HTTP client for one backed by the fake service
+        real_client = frontend.CLIENT
+        frontend.CLIENT = httpx.AsyncClient(transport=httpx.MockTransport(fake_service))
+        calls.clear()
+        yield c
+        frontend.CLIENT = real_client
+
+
+def run_batch(client, dataset):
+    response = client.post("/api/batch", json={"service_url": "http://service", "dataset": dataset})
+    assert response.status_code == 200
+    lines = [frontend.json_loads(line) for line in response.text.splitlines()]
+    return lines[:-1], lines[-1]
+
+
+def test_batch_streams_one_row_per_item_and_summary(client):
+    dataset = [
+        ["Great course", "positive"],
+        ["Okay course", "neutral"],
+        ["Bad course", "positive"],
+        ["Great course", "positive"],
+    ]
+    rows, summary = run_batch(client, dataset)
+
+    assert sorted(row["i"] for row in rows) == [0, 1, 2, 3]
+    assert all("error" not in row for row in rows)
+    assert summary["n"] == 4
+    assert summary["correct"] == 3
+    assert summary["accuracy"] == pytest.approx(0.75)
+
+
+def test_batch_sends_duplicate_texts_once(client):
+    dataset = [["Great course", "positive"]] * 5 + [["Bad course", "negative"]]
+    rows, summary = run_batch(client, dataset)
+
+    assert sorted(row["i"] for row in rows) == list(range(6))
+    assert calls == {"Great course": 1, "Bad course": 1}
+    assert summary["correct"] == 6
+
+
+def test_failed_rows_carry_the_error(client):
+    dataset = [["Server error", "neutral"], ["No score", "neutral"], ["Great course", "positive"]]
+    rows, summary = run_batch(client, dataset)
+    by_index = {row["i"]: row for row in rows}
+
+    assert "HTTP 500" in by_index[0]["error"]
+    assert "'score'" in by_index[1]["error"]
+    # The message is shown as an escaped tooltip on the Score cell
+    assert 'title="External service returned JSON without the required field &#x27;score&#x27;' in by_index[1]["html"]
+    assert "error" not in by_index[2]
+    assert summary["correct"] == 1
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {"service_url": "http://service", "dataset": [["Great course", "excellent"]]},
+        {"service_url": "http://service", "dataset": [["Great course"]]},
+        {"service_url": "http://service", "dataset": [[42, "positive"]]},
+        {"service_url": "http://service", "dataset": "Great course"},
+        {"dataset": []},
+    ],
+)
+def test_bad_items_and_bodies_return_400(client, body):
+    response = client.post("/api/batch", json=body)
+    assert response.status_code == 400
+    assert "detail" in response.json()
+    assert not calls
+
+
+def test_malformed_json_returns_400(client):
+    response = client.post("/api/batch", content=b"{not json", headers={"Content-Type": "application/json"})
+    assert response.status_code == 400
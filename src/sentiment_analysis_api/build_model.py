@@ -1,14 +1,167 @@
 from optimum.onnxruntime import ORTModelForSequenceClassification
 from transformers import AutoTokenizer
-from optimum.onnxruntime.configuration import AutoQuantizationConfig
-from optimum.onnxruntime import ORTQuantizer
+from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+from onnxruntime.transformers import optimizer
+from onnxruntime.transformers.fusion_options import FusionOptions
+import numpy as np
+import onnxruntime as ort
 import os
+import shutil
 
 # 1. Select a Multilingual SENTIMENT Model
 # This model is distilled (small) and trained on 10+ languages (including Danish/English)
 # Labels: "positive", "neutral", "negative"
 model_id = "lxyuan/distilbert-base-multilingual-cased-sentiments-student"
 save_directory = "tiny_model_onnx"
+export_directory = "tiny_model_onnx_fp32"
+
+# Representative inputs (short course evaluations, Danish + English) used to
+# calibrate the activation ranges for static quantization. None of them are in
+# the frontend's evaluation DATASET, so the demo accuracy is not measured on
+# calibration data. heldout_texts are used only to check the quantized model
+# against the FP32 one.
+calibration_texts = [
+    # English
+    "The exercises took far longer than the estimated hours.",
+    "Terrible organisation and the slides were full of mistakes.",
+    "Difficult proofs were broken into small, manageable steps.",
+    "Neither good nor bad, just a regular course.",
+    "I did not learn much and the feedback came very late.",
+    "Excellent course with engaging discussions and useful examples.",
+    "The required textbook was expensive and barely used.",
+    "Solid introduction to the topic, well paced.",
+    "The weekly quizzes kept me on track.",
+    "Way too much content squeezed into too few weeks.",
+    "Lab sessions were chaotic and the TAs seemed unprepared.",
+    "I liked the guest lectures a lot.",
+    "Average course. Some good parts, some boring parts.",
+    "The assignments had nothing to do with the exam.",
+    "Very inspiring teacher, I would take another course with her.",
+    "The online material was outdated and several links were broken.",
+    "Group work was frustrating because the groups were assigned randomly.",
+    "Clear learning goals and a fair exam.",
+    "The pace was fine for me.",
+    "Honestly the worst course I have taken so far.",
+    "Good balance between theory and practice.",
+    "The feedback on the reports was detailed and helpful.",
+    "Lectures started late almost every week.",
+    "Nothing to complain about, nothing to praise either.",
+    "The coding exercises were the best part of the course.",
+    "The grading criteria were never explained.",
+    "I learned more from the textbook than from the lectures.",
+    "A demanding but very rewarding semester.",
+    "The room was too small and it was hard to hear anything.",
+    "Great examples from industry made the theory easier to follow.",
+    "The course felt disorganised from start to finish.",
+    "Mostly fine, although the last two weeks were rushed.",
+    "The teaching assistants were friendly and always available.",
+    "I found the statistics part confusing.",
+    "Well structured slides and recorded lectures, thank you!",
+    "The project deadline clashed with two other exams.",
+    "Interesting topic, mediocre teaching.",
+    "Would recommend this course to anyone interested in machine learning.",
+    "The exam questions were ambiguous.",
+    "It was a normal course with normal workload.",
+    "The teacher clearly loves the subject and it shows.",
+    "We spent far too long on the basics.",
+    "Useful course, but the Friday morning slot was brutal.",
+    "The discussion forum was never answered.",
+    "Fun, practical and well organised.",
+    "I expected more hands-on work.",
+    "The mandatory attendance policy was annoying.",
+    "Everything worked as it should.",
+    "The final project tied all the topics together nicely.",
+    "Boring lectures read straight from the slides.",
+    # Danish
+    "Forelæsningerne var okay, men lokalet var altid koldt.",
+    "Rodet kursus, hvor ingen vidste, hvad der forventedes.",
+    "Underviseren var engageret og gav hurtig og konkret feedback.",
+    "Opgaverne var svære, men jeg blev klogere af dem.",
+    "Der manglede vejledning i starten af projektet.",
+    "Timerne var levende, og alle kom til orde.",
+    "Materialet var fyldt med fejl, og øvelserne gav ingen mening.",
+    "Kurset fungerede, men koordineringen kunne være bedre.",
+    "Godt kursus med en tydelig rød tråd.",
+    "Alt for meget stof på alt for kort tid.",
+    "Øvelsestimerne var kaotiske, og hjælpelærerne virkede uforberedte.",
+    "Gæsteforelæsningerne var rigtig spændende.",
+    "Et gennemsnitligt kursus, hverken godt eller dårligt.",
+    "Afleveringerne havde intet med eksamen at gøre.",
+    "Meget inspirerende underviser, jeg vil gerne have hende igen.",
+    "Det online materiale var forældet, og flere links virkede ikke.",
+    "Gruppearbejdet var frustrerende, fordi grupperne blev tilfældigt sammensat.",
+    "Klare læringsmål og en fair eksamen.",
+    "Tempoet passede mig fint.",
+    "Ærligt talt det dårligste kursus, jeg har haft.",
+    "God balance mellem teori og praksis.",
+    "Feedbacken på rapporterne var grundig og brugbar.",
+    "Forelæsningerne startede for sent næsten hver uge.",
+    "Intet at klage over, men heller ikke noget at rose.",
+    "Programmeringsopgaverne var det bedste ved kurset.",
+    "Bedømmelseskriterierne blev aldrig forklaret.",
+    "Jeg lærte mere af bogen end af forelæsningerne.",
+    "Et krævende, men meget givende semester.",
+    "Lokalet var for lille, og det var svært at høre noget.",
+    "Gode eksempler fra industrien gjorde teorien lettere at forstå.",
+    "Kurset virkede uorganiseret fra start til slut.",
+    "For det meste fint, selvom de sidste to uger var forhastede.",
+    "Hjælpelærerne var venlige og altid til at få fat i.",
+    "Statistikdelen forvirrede mig.",
+    "Velstrukturerede slides og optagede forelæsninger, tak!",
+    "Projektfristen faldt sammen med to andre eksaminer.",
+    "Spændende emne, middelmådig undervisning.",
+    "Jeg kan anbefale kurset til alle, der interesserer sig for maskinlæring.",
+    "Eksamensspørgsmålene var tvetydige.",
+    "Et helt almindeligt kursus med en almindelig arbejdsbyrde.",
+    "Underviseren brænder tydeligvis for faget.",
+    "Vi brugte alt for lang tid på det grundlæggende.",
+    "Nyttigt kursus, men fredag morgen klokken otte var hårdt.",
+    "Ingen svarede nogensinde i diskussionsforummet.",
+    "Sjovt, praktisk og velorganiseret.",
+    "Jeg havde forventet mere praktisk arbejde.",
+    "Mødepligten var irriterende.",
+    "Alt fungerede, som det skulle.",
+    "Slutprojektet samlede alle emnerne på en god måde.",
+    "Kedelige forelæsninger, der blev læst direkte op fra slides.",
+]
+
+# Sanity check after quantization (not used for calibration)
+heldout_texts = [
+    "The exercises were well designed and matched the lectures.",
+    "Nobody knew which room we were supposed to be in.",
+    "The course was alright.",
+    "Fantastic teacher, clear explanations and quick replies to emails.",
+    "The workload was unreasonable compared to the credits.",
+    "Some lectures were great, others were a waste of time.",
+    "I really enjoyed the case studies.",
+    "The exam was far harder than anything we practised.",
+    "A decent course overall.",
+    "The labs crashed constantly and we lost a lot of work.",
+    "Øvelserne var gennemtænkte og passede til forelæsningerne.",
+    "Ingen vidste, hvilket lokale vi skulle være i.",
+    "Kurset var udmærket.",
+    "Fantastisk underviser med klare forklaringer og hurtige svar på mails.",
+    "Arbejdsbyrden stod ikke mål med antallet af point.",
+    "Nogle forelæsninger var gode, andre var spild af tid.",
+    "Jeg var rigtig glad for casene.",
+    "Eksamen var meget sværere end det, vi havde øvet.",
+    "Et fornuftigt kursus alt i alt.",
+    "Computerne i laboratoriet gik ned hele tiden, og vi mistede meget arbejde.",
+]
+
+
+class TextCalibrationReader(CalibrationDataReader):
+    """Feeds tokenized calibration_texts to the ONNX Runtime calibrator, one at a time."""
+
+    def __init__(self, tokenizer, texts):
+        self.inputs = iter(
+            dict(tokenizer(text, return_tensors="np", truncation=True, max_length=128))
+            for text in texts
+        )
+
+    def get_next(self):
+        return next(self.inputs, None)
+
 
 print(f"Downloading and Exporting {model_id} to ONNX...")
 model = ORTModelForSequenceClassification.from_pretrained(
@@ -16,20 +169,81 @@ model = ORTModelForSequenceClassification.from_pretrained(
     export=True
 )
 tokenizer = AutoTokenizer.from_pretrained(model_id)
+model.save_pretrained(export_directory)
 
-# 2. Quantize (Shrink to int8)
-print("Quantizing model...")
-quantizer = ORTQuantizer.from_pretrained(model)
-qconfig = AutoQuantizationConfig.avx512(is_static=False, per_channel=True)
+# 2. Fuse transformer subgraphs (SkipLayerNormalization, EmbedLayerNormalization,
+# Gelu) into single ops *before* quantizing, so the quantizer wraps whole fused
+# kernels instead of many small ops.
+# Attention is left unfused: the QDQ quantizer has no rule for the fused
+# Attention op, so its Q/K/V projection weights would stay FP32. As plain
+# MatMuls they are quantized to int8 like the feed-forward layers.
+# distilbert-base-multilingual: 12 heads, hidden size 768 (handled as "bert").
+print("Fusing transformer operators...")
+fusion_options = FusionOptions("bert")
+fusion_options.enable_attention = False
+fused_model = optimizer.optimize_model(
+    f"{export_directory}/model.onnx",
+    model_type="bert",
+    num_heads=12,
+    hidden_size=768,
+    optimization_options=fusion_options,
+)
+print(f"Fused operators: {fused_model.get_fused_operator_statistics()}")
+fused_model.save_model_to_file(f"{export_directory}/model_fused.onnx")
 
-quantizer.quantize(
-    save_dir=save_directory,
-    quantization_config=qconfig,
+# 3. Quantize (Shrink to int8)
+# Static (calibrated) QDQ quantization with symmetric int8 weights and
+# activations. Unlike dynamic quantization there is no per-inference
+# DynamicQuantizeLinear, and ORT can fuse the QDQ pairs into int8 kernels
+# (VNNI on AVX-512 CPUs).
+print("Quantizing model...")
+os.makedirs(save_directory, exist_ok=True)
+quantize_static(
+    model_input=f"{export_directory}/model_fused.onnx",
+    model_output=f"{save_directory}/model_quantized.onnx",
+    calibration_data_reader=TextCalibrationReader(tokenizer, calibration_texts),
+    quant_format=QuantFormat.QDQ,
+    op_types_to_quantize=["MatMul"],
+    per_channel=True,
+    activation_type=QuantType.QInt8,
+    weight_type=QuantType.QInt8,
+    extra_options={"ActivationSymmetric": True, "WeightSymmetric": True},
+    # Weights go to model_quantized.onnx.data, which ORT can memory-map, so
+    # several API workers share one copy of them in the page cache.
+    use_external_data_format=True,
 )
+
+# 4. Check the int8 model against the FP32 export on the held-out texts.
+# Static activation ranges (e.g. after Gelu) are a common source of accuracy
+# loss, so fail the build if the predicted labels drift too far.
+print("Comparing int8 model with FP32 export...")
+fp32_session = ort.InferenceSession(f"{export_directory}/model.onnx", providers=["CPUExecutionProvider"])
+int8_session = ort.InferenceSession(f"{save_directory}/model_quantized.onnx", providers=["CPUExecutionProvider"])
+
+
+def predict_probs(session, text):
+    names = {i.name for i in session.get_inputs()}
+    encoded = tokenizer(text, return_tensors="np", truncation=True, max_length=128)
+    logits = session.run(None, {k: v for k, v in encoded.items() if k in names})[0][0]
+    exp = np.exp(logits - logits.max())
+    return exp / exp.sum()
+
+
+agree = 0
+max_prob_diff = 0.0
+for text in heldout_texts:
+    fp32_probs = predict_probs(fp32_session, text)
+    int8_probs = predict_probs(int8_session, text)
+    agree += int(fp32_probs.argmax() == int8_probs.argmax())
+    max_prob_diff = max(max_prob_diff, float(np.abs(fp32_probs - int8_probs).max()))
+agreement = agree / len(heldout_texts)
+print(f"Label agreement: {agree}/{len(heldout_texts)} ({agreement:.0%}), max probability difference: {max_prob_diff:.3f}")
+if agreement < 0.9:
+    raise SystemExit("The int8 model disagrees with FP32 on too many held-out texts; check the calibration texts.")
+
 tokenizer.save_pretrained(save_directory)
 
-# Clean up the large non-quantized file to save space
-if os.path.exists(f"{save_directory}/model.onnx"):
-    os.remove(f"{save_directory}/model.onnx")
+# Clean up the large non-quantized export to save space
+shutil.rmtree(export_directory, ignore_errors=True)
 
 print(f"Done! Model saved to {save_directory}/")
\ No newline at end of file
@@ -1,73 +1,336 @@
 from fastapi import FastAPI
 from pydantic import BaseModel
-from optimum.onnxruntime import ORTModelForSequenceClassification
-from transformers import AutoTokenizer
+from tokenizers import Tokenizer
 import numpy as np
+import onnxruntime as ort
+from collections import OrderedDict
+import asyncio
+import concurrent.futures
+import functools
+import hashlib
+import math
+import os
+import queue
+import shutil
+import threading
+import time
 
 app = FastAPI()
 
-# Load the local quantized model
+# Load the local quantized model straight into ONNX Runtime, and its fast
+# (Rust) tokenizer straight from tokenizer.json. Neither needs transformers,
+# which would import torch whenever it is installed.
 model_path = "tiny_model_onnx"
-tokenizer = AutoTokenizer.from_pretrained(model_path)
-model = ORTModelForSequenceClassification.from_pretrained(
-    model_path,
-    file_name="model_quantized.onnx"
-)
+tokenizer_file = os.path.join(model_path, "tokenizer.json")
+if not os.path.exists(tokenizer_file):
+    raise RuntimeError(f"No fast tokenizer (tokenizer.json) found in {model_path}, re-run build_model.py")
+tokenizer = Tokenizer.from_file(tokenizer_file)
+MAX_LENGTH = 128  # Keep max_length=128 for speed
+tokenizer.enable_truncation(MAX_LENGTH)
+
+model_file = "model_quantized.onnx"
+
+# The first start saves ORT's optimized graph to ORT_CACHE_DIR; later starts
+# load that file directly and skip graph optimization. The cached graph is
+# tuned for this machine's CPU, so don't copy the cache directory to another.
+ORT_CACHE_DIR = os.getenv("ORT_CACHE_DIR", ".ort_cache")
+model_file_path = os.path.join(model_path, model_file)
+cached_model_path = os.path.join(ORT_CACHE_DIR, model_file.replace(".onnx", ".optimized.onnx"))
+
+def make_session_options(optimization_level):
+    # Batches run one at a time, so: a small fixed intra-op pool (ORT_INTRA
+    # threads), no inter-op parallelism, and no busy-waiting between runs.
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = int(os.getenv("ORT_INTRA", "4"))
+    options.inter_op_num_threads = 1
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.add_session_config_entry("session.intra_op.allow_spinning", "0")
+    options.graph_optimization_level = optimization_level
+    return options
+
+def open_cached_session():
+    """Session over the cached optimized graph, or None if there is no usable cache."""
+    try:
+        if os.path.getmtime(cached_model_path) < os.path.getmtime(model_file_path):
+            return None
+        options = make_session_options(ort.GraphOptimizationLevel.ORT_DISABLE_ALL)
+        return ort.InferenceSession(cached_model_path, options, providers=["CPUExecutionProvider"])
+    except Exception:  # no cache yet, or a truncated/corrupt one: rebuild it
+        return None
+
+def optimize_session():
+    """Session over the source model that also writes its optimized graph to the cache.
+
+    ORT writes into a per-process temp directory and the files are then moved
+    into place, the graph last, so workers starting at the same time never load
+    a half-written cache. Each writer's weights file carries its pid, so a
+    replaced graph never points at another writer's weights.
+    """
+    level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options = make_session_options(level)
+    stem = os.path.basename(cached_model_path)
+    tmp_dir = os.path.join(ORT_CACHE_DIR, f"tmp-{os.getpid()}")
+    data_file = f"{stem}.{os.getpid()}.data"
+    try:
+        os.makedirs(tmp_dir, exist_ok=True)
+        options.optimized_model_filepath = os.path.join(tmp_dir, stem)
+        # Keep the weights in a separate file here too. ORT aligns them in it,
+        # so they are memory-mapped on later starts and shared between workers.
+        options.add_session_config_entry("session.optimized_model_external_initializers_file_name", data_file)
+    except OSError:  # read-only filesystem: just optimize on every start
+        return ort.InferenceSession(model_file_path, options, providers=["CPUExecutionProvider"])
+
+    session = ort.InferenceSession(model_file_path, options, providers=["CPUExecutionProvider"])
+    try:
+        if os.path.exists(os.path.join(tmp_dir, data_file)):  # not written for tiny models
+            os.replace(os.path.join(tmp_dir, data_file), os.path.join(ORT_CACHE_DIR, data_file))
+        os.replace(os.path.join(tmp_dir, stem), cached_model_path)
+        # Weights of graphs this one replaced. A worker that loses the race
+        # for them falls back to optimizing, see open_cached_session.
+        for name in os.listdir(ORT_CACHE_DIR):
+            if name.startswith(stem + ".") and name.endswith(".data") and name != data_file:
+                os.remove(os.path.join(ORT_CACHE_DIR, name))
+    except OSError:
+        pass
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    return session
+
+session = open_cached_session() or optimize_session()
+input_names = [i.name for i in session.get_inputs()]  # e.g. input_ids, attention_mask
+num_labels = session.get_outputs()[0].shape[-1]
+
+# Dynamic batching: concurrent requests are queued and coalesced into one
+# session run of up to MAX_BATCH texts, waiting at most MAX_WAIT_MS for a batch
+# to fill up. Requests are grouped by token length (buckets of 16/32/64/128
+# tokens) so a short review is never padded up to a long one.
+MAX_BATCH = int(os.getenv("MAX_BATCH", "32"))
+MAX_WAIT_MS = float(os.getenv("MAX_WAIT_MS", "5"))
+
+# IOBinding lets ORT read the model inputs in place and write the logits into
+# a buffer we allocate once. The padded inputs are copied into preallocated
+# buffers too (flat, so a (batch, length) view of the front stays contiguous).
+# Only the inference thread uses these.
+binding = session.io_binding()
+input_bufs = {name: np.zeros(MAX_BATCH * MAX_LENGTH, dtype=np.int64) for name in input_names}
+logits_buf = np.empty((MAX_BATCH, num_labels), dtype=np.float32)
+pad_token_id = tokenizer.token_to_id("[PAD]") or 0
+
+# (encoding, future) pairs waiting for the inference thread. The futures are
+# concurrent.futures ones, so the thread can resolve them directly and any
+# event loop can await them.
+pending = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+# LRU cache of final scores: a repeated text skips tokenization and inference
+SCORE_CACHE_SIZE = int(os.getenv("SCORE_CACHE_SIZE", "8192"))
+_score_cache = OrderedDict()
+_score_cache_lock = threading.Lock()
+# Texts being scored right now (cache key -> future), so concurrent duplicates
+# share one tokenization and model run. Guarded by _score_cache_lock.
+_inflight = {}
 
 class TextInput(BaseModel):
     text: str
 
-def softmax(x):
-    """Compute softmax values for each set of scores in x."""
-    e_x = np.exp(x - np.max(x))
-    return e_x / e_x.sum(axis=0)
+def tokenize(text):
+    """Tokenize one text without padding (Keep max_length=128 for speed)."""
+    # score_batch builds the attention mask from the lengths
+    encoding = tokenizer.encode(text)
+    if "token_type_ids" in input_names:
+        return {"input_ids": encoding.ids, "token_type_ids": encoding.type_ids}
+    return {"input_ids": encoding.ids}
 
-@app.post("/v1/sentiment")
-def analyze_sentiment(input_data: TextInput):
-    # 1. Tokenize (Keep max_length=128 for speed)
-    inputs = tokenizer(
-        input_data.text, 
-        return_tensors="pt", 
-        truncation=True, 
-        max_length=128
-    )
+def length_bucket(n_tokens):
+    """Smallest of 16/32/64/128 that holds n_tokens."""
+    bucket = 16
+    while bucket < n_tokens:
+        bucket *= 2
+    return bucket
+
+def score_batch(encodings):
+    """Run the model once on a list of tokenized texts and return one score per text."""
+    # 1. Pad to the longest text in the batch (a single text is not padded at all)
+    n = len(encodings)
+    length = max(len(encoding["input_ids"]) for encoding in encodings)
+    inputs = {name: input_bufs[name][:n * length].reshape(n, length) for name in input_names}
+    for name, buf in inputs.items():
+        buf.fill(pad_token_id if name == "input_ids" else 0)
+        for row, encoding in zip(buf, encodings):
+            if name == "attention_mask":
+                row[:len(encoding["input_ids"])] = 1
+            elif name in encoding:
+                row[:len(encoding[name])] = encoding[name]
     
     # 2. Inference
-    outputs = model(**inputs)
+    for name in input_names:
+        binding.bind_cpu_input(name, inputs[name])
+    binding.bind_output("logits", "cpu", 0, np.float32, [n, num_labels], logits_buf.ctypes.data)
+    session.run_with_iobinding(binding)
     
-    # 3. Get Probabilities
-    logits = outputs.logits[0].detach().numpy()
-    probs = softmax(logits)
-    
-    # Map probabilities to variables (CHECK YOUR MODEL'S ID2LABEL MAPPING!)
+    if n == 1:
+        return [logits_to_score(logits_buf[0])]
+    return logits_to_scores(logits_buf[:n])
+
+def logits_to_score(logits):
+    """Map the model's 3 logits for one text to a score in [-5, 5]."""
+    # Map logits to variables (CHECK YOUR MODEL'S ID2LABEL MAPPING!)
     # For lxyuan/distilbert-base-multilingual-cased-sentiments-student:
     # 0 = positive, 1 = neutral, 2 = negative
-    prob_pos = float(probs[0])
-    prob_neu = float(probs[1])
-    prob_neg = float(probs[2])
-    
-    # 4. Winner-Takes-All Scoring
-    # Find which bucket has the highest probability
-    winner_index = np.argmax(probs)
-    
-    final_score = 0.0
+    logit_pos, logit_neu, logit_neg = float(logits[0]), float(logits[1]), float(logits[2])
 
-    if winner_index == 0:  # POSITIVE WINS
+    # 3. + 4. Winner-Takes-All Scoring
+    # The winner is the highest logit (softmax is monotonic, so no need to
+    # compute it first; ties go to the lower index, like np.argmax). Only the
+    # probabilities the score uses are computed, relative to the winning logit
+    # so every exp() argument is <= 0 and cannot overflow.
+    if logit_pos >= logit_neu and logit_pos >= logit_neg:  # POSITIVE WINS
         # Base score 3, plus extra confidence
         # Range: 3.0 to 5.0
+        prob_pos = 1.0 / (1.0 + math.exp(logit_neu - logit_pos) + math.exp(logit_neg - logit_pos))
         final_score = 3.0 + (prob_pos * 2.0)
         
-    elif winner_index == 2: # NEGATIVE WINS
+    elif logit_neg > logit_neu: # NEGATIVE WINS
         # Base score -3, minus extra confidence
         # Range: -3.0 to -5.0
+        prob_neg = 1.0 / (1.0 + math.exp(logit_pos - logit_neg) + math.exp(logit_neu - logit_neg))
         final_score = -3.0 - (prob_neg * 2.0)
         
     else: # NEUTRAL WINS (Index 1)
         # Keep it close to 0, but allow slight drift based on bias
-        # Range: -0.5 to 0.5
-        final_score = (prob_pos - prob_neg)
+        # Range: -0.5 to 0.5 (prob_pos - prob_neg)
+        e_pos = math.exp(logit_pos - logit_neu)
+        e_neg = math.exp(logit_neg - logit_neu)
+        final_score = (e_pos - e_neg) / (1.0 + e_pos + e_neg)
 
     # 5. Final Clamp
     final_score = max(-5, min(5, final_score))
 
-    return {"score": float(final_score)}
\ No newline at end of file
+    return float(final_score)
+
+def logits_to_scores(logits):
+    """Vectorized logits_to_score for a (n, 3) array of logits: one numpy pass per batch."""
+    logits = logits.astype(np.float64)
+    winner = logits.argmax(axis=1)  # 0 = positive, 1 = neutral, 2 = negative
+    exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+    probs = exp / exp.sum(axis=1, keepdims=True)
+    prob_pos, prob_neg = probs[:, 0], probs[:, 2]
+    scores = np.where(winner == 0, 3.0 + prob_pos * 2.0,
+                      np.where(winner == 2, -3.0 - prob_neg * 2.0, prob_pos - prob_neg))
+    return np.clip(scores, -5, 5).tolist()
+
+def _cache_key(text):
+    # Long texts are keyed by a digest so the cache does not keep them alive
+    if len(text) <= 256:
+        return text
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+def get_cached_score(key):
+    with _score_cache_lock:
+        score = _score_cache.get(key)
+        if score is not None:
+            _score_cache.move_to_end(key)
+        return score
+
+def _join_inflight(key):
+    """Future for the text's score, and whether the caller must submit the text."""
+    with _score_cache_lock:
+        future = _inflight.get(key)
+        if future is not None:
+            return future, False
+        future = _inflight[key] = concurrent.futures.Future()
+    future.add_done_callback(functools.partial(_finish_inflight, key))
+    return future, True
+
+def _finish_inflight(key, future):
+    # Cache the score and drop the in-flight entry in one step, so a new
+    # request always finds the text in one or the other.
+    with _score_cache_lock:
+        if future.exception() is None:
+            _score_cache[key] = future.result()
+            _score_cache.move_to_end(key)
+            if len(_score_cache) > SCORE_CACHE_SIZE:
+                _score_cache.popitem(last=False)
+        del _inflight[key]
+
+def _submit(text, future):
+    """Tokenize the text and queue it for the inference thread (runs on a worker thread)."""
+    try:
+        pending.put((tokenize(text), future))
+    except Exception as e:
+        future.set_exception(e)
+
+def _inference_loop():
+    """Inference thread: collect queued requests into length buckets and score them."""
+    buckets = {}  # bucket size -> [(arrival time, encoding, future), ...]
+
+    def add(item):
+        encoding, future = item
+        size = length_bucket(len(encoding["input_ids"]))
+        buckets.setdefault(size, []).append((time.monotonic(), encoding, future))
+
+    while True:
+        if not buckets:
+            add(pending.get())
+
+        # Wait for more requests until some bucket is full or the oldest
+        # waiting request has waited MAX_WAIT_MS.
+        oldest = min(items[0][0] for items in buckets.values())
+        deadline = oldest + MAX_WAIT_MS / 1000.0
+        while max(len(items) for items in buckets.values()) < MAX_BATCH:
+            remaining = deadline - time.monotonic()
+            try:
+                add(pending.get(timeout=remaining) if remaining > 0 else pending.get_nowait())
+            except queue.Empty:
+                break
+
+        # Buckets whose oldest request has waited MAX_WAIT_MS run first, oldest
+        # first, so a lone long text is not starved by a stream of full batches
+        # of short ones. Otherwise run a full bucket, then the oldest one.
+        now = time.monotonic()
+
+        def priority(size):
+            arrival = buckets[size][0][0]
+            overdue = now - arrival >= MAX_WAIT_MS / 1000.0
+            return (overdue, overdue or len(buckets[size]) >= MAX_BATCH, -arrival)
+
+        size = max(buckets, key=priority)
+        batch = buckets[size][:MAX_BATCH]
+        del buckets[size][:MAX_BATCH]
+        if not buckets[size]:
+            del buckets[size]
+
+        try:
+            scores, error = score_batch([encoding for _, encoding, _ in batch]), None
+        except Exception as e:
+            scores, error = [None] * len(batch), e
+        for (_, _, future), score in zip(batch, scores):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(score)
+
+def _ensure_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_inference_loop, name="inference", daemon=True)
+            _worker.start()
+
+@app.post("/v1/sentiment")
+async def analyze_sentiment(input_data: TextInput):
+    # Tokenize on a worker thread, then hand the text to the inference thread
+    # and wait for its batch to finish. Neither step blocks the event loop, so
+    # new requests are tokenized while the model runs on earlier ones.
+    key = _cache_key(input_data.text)
+    score = get_cached_score(key)
+    if score is None:
+        future, submit = _join_inflight(key)
+        if submit:
+            _ensure_worker()
+            # Not awaited, so a disconnecting client can't cancel the submission
+            # that other requests for the same text are waiting on.
+            asyncio.get_running_loop().run_in_executor(None, _submit, input_data.text, future)
+        # shield: cancelling this request must not cancel the shared future
+        score = await asyncio.shield(asyncio.wrap_future(future))
+    return {"score": score}
\ No newline at end of file
@@ -15,7 +15,11 @@ if project_root not in sys.path:
 # --- END PATH SETUP ---
 
 # Now this import will work because Python can see the 'src' folder
+import asyncio
+import httpx
+import pytest
 from fastapi.testclient import TestClient
+from src.sentiment_analysis_api import main
 from src.sentiment_analysis_api.main import app
 
 client = TestClient(app)
@@ -30,7 +34,32 @@ def test_negative_sentiment():
     assert response.status_code == 200
     assert response.json() == {"score": -3}
 
+def test_concurrent_requests_match_single_requests():
+    # Enough concurrent texts of mixed length to fill several length buckets
+    # and batches, so queueing, padding and scattering the results back are
+    # all exercised together.
+    phrases = ["Det var en god lærer.", "It was a bad course", "The exam was fair, but the pace was uneven."]
+    texts = [f"{i}: " + " ".join([phrases[i % 3]] * (1 + i % 9)) for i in range(36)]
+
+    async def post_all():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            responses = await asyncio.gather(*(c.post("/v1/sentiment", json={"text": t}) for t in texts))
+        return [r.json()["score"] for r in responses]
+
+    main._score_cache.clear()
+    concurrent = asyncio.run(post_all())
+    main._score_cache.clear()
+    single = [client.post("/v1/sentiment", json={"text": t}).json()["score"] for t in texts]
+    assert concurrent == pytest.approx(single, abs=1e-5)
+
+def test_torch_not_imported():
+    # The API only needs onnxruntime and tokenizers; torch would add seconds of startup
+    assert "torch" not in sys.modules
+
 if __name__ == "__main__":
     test_positive_sentiment()
     test_negative_sentiment()
+    test_concurrent_requests_match_single_requests()
+    test_torch_not_imported()
     print("All tests passed!")
\ No newline at end of file